@@ -0,0 +1,160 @@
+###############################################
+### Streaming deduplication of invoice rows ### - hash based, across chunks and files
+###############################################
+
+# df_invoice.drop_duplicates() needs the whole invoice table in memory and
+# can not find duplicates across several (monthly) export files.
+# Here each row is reduced to a 64-bit fingerprint (hash of all column values).
+# read_csv() infers the dtypes chunk by chunk (e.g. 0 in one chunk and '0' or 0.0 in the next one), so
+#   - the columns with text or mixed values are read as str (INVOICE_TEXT_DTYPES),
+#   - numerical columns are hashed as float64 (int in one chunk, float with missing values in the next one).
+# The fingerprints of all rows seen so far are kept in a sorted uint64 array (8 bytes per unique row),
+# so duplicates can be dropped while the files are read chunk by chunk.
+#
+# Main function: read_invoice_files_deduplicated()
+# - uses iter_deduplicated_invoice_chunks() and the FingerprintSet class defined below
+
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+CHUNKSIZE = 500_000  # invoice rows per chunk (default)
+INVOICE_TEXT_DTYPES = {'client_id': str, 'counter_statue': str, 'counter_type': str}  # str or mixed values
+
+
+def hash_rows(data: pd.DataFrame, columns=None) -> np.ndarray:
+    """ Compute a 64-bit fingerprint for each row of a DF from the values in 'columns'.
+        Identical rows have identical fingerprints (also across chunks and files).
+        Numerical columns are hashed as float64, so int and float chunks of a column give the same fingerprint.
+        Columns with text values must have the same dtype in all chunks (see INVOICE_TEXT_DTYPES).
+
+    Args:
+        data (pd.DataFrame):        Input DF, e.g. a chunk of the invoice data.
+        columns (list, optional):   Columns used for the fingerprint. Defaults to None (all columns).
+
+    Returns:
+        np.ndarray:                 uint64 fingerprint for each row.
+    """
+    if columns is not None:
+        data = data[columns]
+
+    # one canonical numerical dtype (bool columns are kept)
+    canonical = {column: np.float64 for column, dtype in data.dtypes.items()
+                 if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)}
+
+    return pd.util.hash_pandas_object(data.astype(canonical), index=False).to_numpy()
+
+
+class FingerprintSet:
+    """ Set of row fingerprints stored as a sorted uint64 array.
+        Uses a fraction of the memory of a python set (8 bytes per fingerprint).
+    """
+
+    def __init__(self):
+        self.fingerprints = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        """ Add fingerprints to the set and return which of them are new.
+
+        Args:
+            hashes (np.ndarray):    uint64 fingerprints (see hash_rows()).
+
+        Returns:
+            np.ndarray:             Boolean mask, True for the first occurrence of a fingerprint
+                                    that was not in the set before, False for duplicates.
+        """
+        # first occurrence of each fingerprint within the hashes (sorted by fingerprint)
+        unique_hashes, first_index = np.unique(hashes, return_index=True)
+
+        # fingerprints that were already seen (in previous chunks or files)
+        positions = np.searchsorted(self.fingerprints, unique_hashes)
+        in_set = np.zeros(len(unique_hashes), dtype=bool)
+        found = positions < len(self.fingerprints)
+        in_set[found] = self.fingerprints[positions[found]] == unique_hashes[found]
+
+        # insert the new fingerprints (keeps the array sorted)
+        self.fingerprints = np.insert(self.fingerprints, positions[~in_set], unique_hashes[~in_set])
+
+        is_new = np.zeros(len(hashes), dtype=bool)
+        is_new[first_index[~in_set]] = True
+
+        return is_new
+
+
+def iter_deduplicated_invoice_chunks(paths: list | str,
+                                     report: list,
+                                     columns=None,
+                                     chunksize=CHUNKSIZE,
+                                     seen=None,
+                                     **read_csv_kwargs):
+    """ Read one or more invoice csv files chunk by chunk and drop exact duplicate rows,
+        both within a file and across files. For each chunk a summary is appended to 'report'.
+        The columns in INVOICE_TEXT_DTYPES are read as str (unless another dtype is passed for them).
+        Other columns with text or mixed values should be passed as str dtype as well.
+
+    Args:
+        paths (list | str):         Path or list of paths to invoice csv files (e.g. monthly exports).
+        report (list):              List to which a dict is appended for each chunk with the keys
+                                    'file', 'chunk', 'rows', 'duplicates' and 'kept'.
+        columns (list, optional):   Columns used to identify duplicates. Defaults to None (all columns).
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+        seen (optional):            FingerprintSet of rows that were already loaded (e.g. from a previous run).
+                                    Defaults to None (empty set).
+        **read_csv_kwargs:          Passed to pd.read_csv() (e.g. dtype, parse_dates, usecols).
+
+    Yields:
+        pd.DataFrame:               Chunk without duplicated rows.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    if seen is None:
+        seen = FingerprintSet()
+    if isinstance(read_csv_kwargs.get('dtype', {}), dict):
+        read_csv_kwargs['dtype'] = {**INVOICE_TEXT_DTYPES, **read_csv_kwargs.get('dtype', {})}
+
+    for path in paths:
+        for i, chunk in enumerate(pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs)):
+            is_new = seen.add(hash_rows(chunk, columns))
+            report.append({'file': os.path.basename(path),
+                           'chunk': i,
+                           'rows': len(chunk),
+                           'duplicates': int((~is_new).sum()),
+                           'kept': int(is_new.sum()),
+                           })
+            yield chunk[is_new]
+
+
+def read_invoice_files_deduplicated(paths: list | str, columns=None, chunksize=CHUNKSIZE, verbose=True,
+                                    **read_csv_kwargs) -> tuple:
+    """ Load one or more invoice csv files into one DF without exact duplicate rows.
+        Replaces pd.read_csv() followed by df_invoice.drop_duplicates().
+
+    Args:
+        paths (list | str):         Path or list of paths to invoice csv files.
+        columns (list, optional):   Columns used to identify duplicates. Defaults to None (all columns).
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+        verbose (bool, optional):   Defaults to True. If False the number of dropped rows is not printed.
+        **read_csv_kwargs:          Passed to pd.read_csv() (e.g. dtype, parse_dates, low_memory).
+
+    Returns:
+        tuple(pd.DataFrame, pd.DataFrame):  Deduplicated invoice data and a report with the number of
+                                            dropped duplicates per file.
+    """
+    report = []
+    chunks = list(iter_deduplicated_invoice_chunks(paths, report, columns, chunksize, **read_csv_kwargs))
+    df_invoice = pd.concat(chunks, ignore_index=True)
+
+    df_report = pd.DataFrame(report).groupby('file', sort=False, as_index=False)[['rows', 'duplicates', 'kept']].sum()
+
+    if verbose:
+        print(f'{df_report.duplicates.sum()} of {df_report.rows.sum()} invoice rows were dropped as duplicates.')
+        for row in df_report.itertuples():
+            print(f' {row.file}: {row.duplicates} duplicates')
+
+    return df_invoice, df_report
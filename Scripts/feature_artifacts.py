@@ -0,0 +1,306 @@
+##################################################################
+### Fit/ transform of the model features with a saved artifact ### - for test set and production data
+##################################################################
+
+# The fraud risk features are learned from the training data (fraud rate per category
+# compared to the baseline, see subplopts_fraud_per_category() and create_fraud_risk_feature()).
+# fit_feature_artifact() captures everything that is learned from the training data:
+#
+#   - risk mappings:    category -> fraud risk (0 = low, 1 = normal, 2 = high) for each risk feature,
+#                       incl. the categories that are in none of the lists (coded as in create_fraud_risk_feature())
+#   - feature lists:    NUM_FEATURES and CAT_FEATURES
+#   - column order, dtypes and category levels of the model DF
+#
+# The artifact is a dict that is saved as a versioned json file (save_feature_artifact()).
+# transform_features() applies it to new client data with vectorized lookups
+# without recomputing any training statistics. The clientwise aggregations
+# (account duration, mode and count, consumption features) do not depend on
+# the training data and are created with the functions in preprocessing.py as before.
+
+
+import json
+
+import numpy as np
+import pandas as pd
+
+
+ARTIFACT_VERSION = 2
+RISK_PREFIX = 'risk'
+UNKNOWN_RISK = 1  # categories that never appeared in the training data are treated as normal risk
+
+
+#####################
+### Risk mappings ### - without plotting
+#####################
+
+
+def fit_risk_categories(data: pd.DataFrame, feature: str, fraud_baseline: float, fraud_range: float,
+                        target='target') -> tuple:
+    """ Split the categories of a feature into low, normal and high fraud risk compared to the baseline.
+        Same result as the fraud_risk_categories returned by subplopts_fraud_per_category(), but without plotting:
+        categories without any fraud case are in none of the lists (create_fraud_risk_feature() codes them as 2).
+
+    Args:
+        data (pd.DataFrame):    DF with columns feature and target.
+        feature (str):          Name of the categorical feature.
+        fraud_baseline (float): Fraud rate in percent in the overall sample.
+        fraud_range (float):    Range around the baseline in which the fraud rate is considered normal.
+        target (str, optional): Name of the target column. Defaults to 'target'.
+
+    Returns:
+        tuple([list], [list], [list]):  Categories with low, normal and high fraud risk.
+    """
+    grouped = data[target].astype(int).groupby(data[feature], observed=True, dropna=False)
+    fraud_rate = grouped.mean() * 100
+    # only the categories with fraud cases (rows with target 1 in aggregate_feature_by_target()) are assigned
+    fraud_rate = fraud_rate[grouped.sum() > 0]
+
+    low = fraud_rate[fraud_rate < fraud_baseline - fraud_range]
+    normal = fraud_rate[(fraud_rate < fraud_baseline + fraud_range) & (fraud_rate > fraud_baseline - fraud_range)]
+    high = fraud_rate[fraud_rate > fraud_baseline + fraud_range]
+
+    return (list(low.index), list(normal.index), list(high.index))
+
+
+def category_key(category) -> str:
+    """ Return the str key of a category: whole floats without decimals (11.0 -> '11', as int 11),
+        because a column with missing values is float in one DF and int in another.
+    """
+    if isinstance(category, (float, np.floating)) and category.is_integer():
+        return str(int(category))
+
+    return str(category)
+
+
+def category_keys(values: pd.Series) -> np.ndarray:
+    """ Vectorized category_key() (applied to the unique values only), missing values become 'nan'.
+    """
+    categorical = pd.Categorical(values)
+    keys = np.array([category_key(category) for category in categorical.categories] + ['nan'], dtype=object)
+
+    # codes are -1 for missing values, which selects the last entry
+    return keys[categorical.codes]
+
+
+def risk_categories_to_mapping(new_categories: tuple | list) -> tuple:
+    """ Convert the risk categories (same input as 'new_categories' in create_fraud_risk_feature())
+        into a dict category -> fraud risk. Categories are stored as str (see category_key()).
+        Also return the risk that create_fraud_risk_feature() assigns to categories that are in none of the lists.
+
+    Args:
+        new_categories (tuple | list):  Tuple with up to 3 lists (low, normal, high) or a single list
+                                        with the high risk categories.
+
+    Returns:
+        tuple(dict, int):               Category (str) as key and fraud risk (int) as value,
+                                        and the default risk (0 for a single list or 2 lists, 2 for 3 lists).
+    """
+    if not any(isinstance(i, list) for i in new_categories):
+        # a single list with the high risk categories, all others 0
+        return {category_key(category): 1 for category in new_categories}, 0
+
+    if len(new_categories) == 3:
+        # list[0] -> 0, list[1] -> 1, all others 2
+        risk_values, default_risk = (0, 1), 2
+    elif len(new_categories) == 2:
+        # list[1] -> 1, all others (incl. list[0]) 0
+        risk_values, default_risk = (0, 1), 0
+    elif len(new_categories) == 1:
+        # a single (nested) list with the high risk categories, all others 0
+        risk_values, default_risk = (1,), 0
+    else:
+        raise ValueError('The number of categories for the new feature is invalid (<1 or >3).')
+
+    mapping = {}
+    for categories, risk in zip(new_categories, risk_values):
+        for category in categories:
+            mapping[category_key(category)] = risk
+
+    return mapping, default_risk
+
+
+def map_risk_feature(values: pd.Series, mapping: dict, unknown_risk=UNKNOWN_RISK) -> np.ndarray:
+    """ Vectorized lookup of the fraud risk for each value (instead of a list comprehension over all rows).
+
+    Args:
+        values (pd.Series):             Values of the original categorical feature.
+        mapping (dict):                 Category (str) -> fraud risk (see risk_categories_to_mapping()).
+        unknown_risk (int, optional):   Risk for categories that are not in the mapping (never seen in training).
+                                        Defaults to UNKNOWN_RISK.
+
+    Returns:
+        np.ndarray:                     int8 array with the fraud risk of each value.
+    """
+    categories = list(mapping.keys())
+    lookup = np.array(list(mapping.values()) + [unknown_risk], dtype=np.int8)
+
+    # codes are -1 for unknown categories, which selects the last entry of the lookup table
+    codes = pd.Categorical(category_keys(values), categories=categories).codes
+
+    return lookup[codes]
+
+
+###########
+### Fit ###
+###########
+
+
+def fit_feature_artifact(df_merged: pd.DataFrame,
+                         risk_features: list | dict,
+                         num_features: list,
+                         cat_features: list,
+                         fraud_baseline=None,
+                         fraud_range=1.5,
+                         client_id='client_id',
+                         target='target') -> dict:
+    """ Capture the learned state of the feature engineering from the training data.
+
+    Args:
+        df_merged (pd.DataFrame):       Training DF with one row per client, the original categorical features,
+                                        the numerical features and the target.
+        risk_features (list | dict):    Features for which a risk feature is created.
+                                        A list of feature names (risk categories are fitted here) or a dict
+                                        feature name -> risk categories (e.g. from subplopts_fraud_per_category()).
+        num_features (list):            NUM_FEATURES used for modelling.
+        cat_features (list):            CAT_FEATURES used for modelling (incl. the risk features).
+        fraud_baseline (float, optional):   Fraud rate in percent. Defaults to None (computed from target).
+        fraud_range (float, optional):  Range around the baseline considered normal. Defaults to 1.5.
+        client_id (str, optional):      Name of the client id column. Defaults to 'client_id'.
+        target (str, optional):         Name of the target column. Defaults to 'target'.
+
+    Returns:
+        dict:                           Feature artifact (see module description).
+    """
+    if fraud_baseline is None:
+        fraud_baseline = df_merged[target].astype(int).mean() * 100
+
+    if isinstance(risk_features, list):
+        risk_features = {feature: fit_risk_categories(df_merged, feature, fraud_baseline, fraud_range, target)
+                         for feature in risk_features}
+
+    risk_mappings = {}
+    risk_defaults = {}
+    for feature, categories in risk_features.items():
+        mapping, default_risk = risk_categories_to_mapping(categories)
+        # training categories that are in none of the lists get the default risk of create_fraud_risk_feature()
+        for category in pd.unique(category_keys(df_merged[feature])):
+            mapping.setdefault(category, default_risk)
+        risk_mappings[feature] = mapping
+        risk_defaults[feature] = default_risk
+
+    # dtypes and category levels of the model columns
+    dtypes = {}
+    category_levels = {}
+    for feature in num_features:
+        dtypes[feature] = str(df_merged[feature].dtype)
+    for feature in cat_features:
+        feature_in = feature.removeprefix(f'{RISK_PREFIX}_')
+        if feature.startswith(f'{RISK_PREFIX}_') and feature_in in risk_mappings:
+            # risk features are str categories of the risk values (as with create_fraud_risk_feature())
+            levels = sorted(set(risk_mappings[feature_in].values()) | {UNKNOWN_RISK})
+            category_levels[feature] = [str(level) for level in levels]
+        else:
+            category_levels[feature] = sorted(level for level in pd.unique(category_keys(df_merged[feature]))
+                                             if level != 'nan')
+        dtypes[feature] = 'category'
+
+    artifact = {'version': ARTIFACT_VERSION,
+                'fraud_baseline': fraud_baseline,
+                'fraud_range': fraud_range,
+                'client_id': client_id,
+                'target': target,
+                'risk_mappings': risk_mappings,
+                'risk_defaults': risk_defaults,
+                'num_features': list(num_features),
+                'cat_features': list(cat_features),
+                'columns': [client_id] + list(num_features) + list(cat_features),
+                'dtypes': dtypes,
+                'category_levels': category_levels,
+                }
+
+    return artifact
+
+
+###################
+### Save and load ###
+###################
+
+
+def save_feature_artifact(artifact: dict, path: str):
+    """ Save the feature artifact as json file.
+
+    Args:
+        artifact (dict):    Output of fit_feature_artifact().
+        path (str):         Path of the json file, e.g. '../data/files/feature_artifact.json'.
+    """
+    with open(path, 'w') as file:
+        json.dump(artifact, file, indent=2)
+
+
+def load_feature_artifact(path: str) -> dict:
+    """ Load a feature artifact saved with save_feature_artifact().
+
+    Args:
+        path (str): Path of the json file.
+
+    Returns:
+        dict:       Feature artifact.
+    """
+    with open(path) as file:
+        artifact = json.load(file)
+
+    if artifact.get('version') != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported artifact version {artifact.get('version')} (expected {ARTIFACT_VERSION}).")
+
+    return artifact
+
+
+#################
+### Transform ### - fast path for test set and production data
+#################
+
+
+def transform_features(data: pd.DataFrame, artifact: dict, keep_target=False) -> pd.DataFrame:
+    """ Create the model DF from new client data with the learned state of the artifact.
+        Risk features are looked up from the risk mappings, columns are ordered and
+        dtypes/ category levels are set as in the training data.
+
+    Args:
+        data (pd.DataFrame):            DF with one row per client, the original categorical features
+                                        and the numerical features (e.g. df_merged of the test data).
+        artifact (dict):                Output of fit_feature_artifact() or load_feature_artifact().
+        keep_target (bool, optional):   Defaults to False. Set to True to keep the target column (test set).
+
+    Returns:
+        pd.DataFrame:                   Model DF with the columns artifact['columns'].
+    """
+    columns = {}
+    for feature_in, mapping in artifact['risk_mappings'].items():
+        if feature_in in data.columns:
+            columns[f'{RISK_PREFIX}_{feature_in}'] = map_risk_feature(data[feature_in], mapping).astype(str)
+
+    missing = [column for column in artifact['columns'] if column not in columns and column not in data.columns]
+    if missing:
+        raise ValueError(f'Missing columns in the data: {missing}')
+
+    df_model = pd.DataFrame({column: columns[column] if column in columns else data[column].to_numpy()
+                             for column in artifact['columns']}, index=data.index)
+
+    for feature in artifact['num_features']:
+        dtype = artifact['dtypes'][feature]
+        if df_model[feature].isna().any() and dtype.startswith(('int', 'uint', 'bool')):
+            # missing values (e.g. a client without gas invoices) can not be stored as int: float as with a merge
+            dtype = 'float64'
+        try:
+            df_model[feature] = df_model[feature].astype(dtype)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f'The values of {feature} can not be converted to {dtype} (training dtype '
+                             f"{artifact['dtypes'][feature]}): {error}") from error
+    for feature in artifact['cat_features']:
+        df_model[feature] = pd.Categorical(category_keys(df_model[feature]),
+                                           categories=artifact['category_levels'][feature])
+
+    if keep_target:
+        df_model[artifact['target']] = data[artifact['target']].to_numpy()
+
+    return df_model
@@ -0,0 +1,216 @@
+###################################################################
+### Export/ import of the model feature matrix as binary arrays ### - memory-mapped
+###################################################################
+
+# Reading 'df_model.csv' parses all values as text and inflates them to float64 on every run.
+# export_model_matrix() writes the final model matrix once to a folder with:
+#
+#   numerical.npy   -> float32 array (clients x NUM_FEATURES)
+#   categorical.npy -> int8 array (clients x CAT_FEATURES), missing values = -1:
+#                      the values themselves for integer levels 0 to 127 (e.g. the ordinal risk features 0/1/2),
+#                      otherwise the category codes
+#   client_id.npy   -> client ids
+#   target.npy      -> int8 array with target (fraud = 1/ no fraud = 0)
+#   manifest.json   -> column names, original dtypes, category levels and the encoding ('values' or 'codes')
+#
+# load_model_matrix() memory-maps the arrays (read only), so loading is near-instant, nothing is copied
+# and several training processes share the same pages of the operating system's file cache.
+
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+MANIFEST_VERSION = 2
+
+NUMERICAL_FILE = 'numerical.npy'
+CATEGORICAL_FILE = 'categorical.npy'
+CLIENT_ID_FILE = 'client_id.npy'
+TARGET_FILE = 'target.npy'
+MANIFEST_FILE = 'manifest.json'
+
+
+##############
+### Export ###
+##############
+
+
+def integer_levels(levels) -> list | None:
+    """ Return the category levels as int when all of them are whole numbers from 0 to 127
+        (int, whole float or digit str, e.g. the levels '0' and '2' of a risk feature), otherwise None.
+    """
+    values = []
+    for level in levels:
+        if isinstance(level, str) and level.isdigit():
+            level = int(level)
+        elif isinstance(level, (float, np.floating)) and level.is_integer():
+            level = int(level)
+        if not isinstance(level, (int, np.integer)) or isinstance(level, (bool, np.bool_)):
+            return None
+        values.append(int(level))
+
+    if values and (min(values) < 0 or max(values) > np.iinfo(np.int8).max):
+        return None
+
+    return values
+
+
+def export_model_matrix(df_model: pd.DataFrame,
+                        path: str,
+                        cat_features: list,
+                        num_features=None,
+                        client_id='client_id',
+                        target='target') -> dict:
+    """ Write the model matrix to the folder 'path' as binary arrays plus a manifest (see module description).
+        The arrays are filled column by column, so no float64 copy of the whole matrix is created.
+
+    Args:
+        df_model (pd.DataFrame):        DF with columns client_id, target, numerical and categorical features.
+        path (str):                     Output folder (created if it does not exist).
+        cat_features (list):            Categorical features (e.g. CAT_FEATURES), at most 127 categories each.
+        num_features (list, optional):  Numerical features. Defaults to None, which selects all columns
+                                        that are not in cat_features, client_id or target.
+        client_id (str, optional):      Name of the client id column. Defaults to 'client_id'.
+        target (str, optional):         Name of the target column. Defaults to 'target'.
+
+    Returns:
+        dict:                           Manifest that was written to manifest.json.
+    """
+    if num_features is None:
+        num_features = list(df_model.columns[~df_model.columns.isin(cat_features + [client_id, target])])
+    num_features = list(num_features)
+    cat_features = list(cat_features)
+    n_rows = len(df_model)
+
+    os.makedirs(path, exist_ok=True)
+
+    # numerical features: float32 written column by column
+    numerical = np.lib.format.open_memmap(os.path.join(path, NUMERICAL_FILE), mode='w+',
+                                          dtype=np.float32, shape=(n_rows, len(num_features)))
+    for i, feature in enumerate(num_features):
+        numerical[:, i] = pd.to_numeric(df_model[feature]).to_numpy(dtype=np.float32)
+    numerical.flush()
+    del numerical
+
+    # categorical features: int8 values (integer levels) or codes, the levels go into the manifest
+    categorical = np.lib.format.open_memmap(os.path.join(path, CATEGORICAL_FILE), mode='w+',
+                                            dtype=np.int8, shape=(n_rows, len(cat_features)))
+    category_levels = {}
+    category_encoding = {}
+    for i, feature in enumerate(cat_features):
+        values = df_model[feature].astype('category')
+        levels = values.cat.categories
+        codes = values.cat.codes.to_numpy(dtype=np.int8)
+        level_values = integer_levels(levels)
+        if level_values is not None:
+            # keep the (ordinal) values instead of the position of the category
+            lookup = np.array(level_values + [-1], dtype=np.int8)
+            categorical[:, i] = lookup[codes]
+            category_encoding[feature] = 'values'
+        else:
+            if len(levels) > np.iinfo(np.int8).max:
+                raise ValueError(f'The feature {feature} has {len(levels)} categories, int8 codes allow at most 127.')
+            categorical[:, i] = codes
+            category_encoding[feature] = 'codes'
+        category_levels[feature] = [level.item() if isinstance(level, np.generic) else level for level in levels]
+    categorical.flush()
+    del categorical
+
+    # client ids as integers (or fixed-width strings), object arrays can not be memory-mapped
+    client_ids = df_model[client_id].astype(str)
+    if client_ids.str.isdigit().all():
+        client_ids = client_ids.to_numpy(dtype=np.int64)
+    else:
+        client_ids = np.asarray(client_ids, dtype=str)
+    np.save(os.path.join(path, CLIENT_ID_FILE), client_ids)
+    np.save(os.path.join(path, TARGET_FILE), df_model[target].astype(int).to_numpy(dtype=np.int8))
+
+    manifest = {'version': MANIFEST_VERSION,
+                'n_rows': n_rows,
+                'client_id': client_id,
+                'target': target,
+                'num_features': num_features,
+                'cat_features': cat_features,
+                'dtypes': {column: str(df_model[column].dtype) for column in num_features + cat_features},
+                'category_levels': category_levels,
+                'category_encoding': category_encoding,
+                }
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+##############
+### Import ###
+##############
+
+
+def load_model_matrix(path: str, mmap_mode='r') -> dict:
+    """ Load a model matrix written by export_model_matrix().
+        With mmap_mode='r' the arrays are memory-mapped (zero-copy, read only).
+
+    Args:
+        path (str):                 Folder with the arrays and manifest.json.
+        mmap_mode (str, optional):  Memory-map mode passed to np.load(). Defaults to 'r'.
+                                    Set to None to read the arrays into memory.
+
+    Returns:
+        dict:                       Keys 'numerical' (float32), 'categorical' (int8 values or codes, see
+                                    manifest['category_encoding']), 'client_id', 'target' (arrays) and
+                                    'manifest' (dict). The feature names are manifest['num_features']
+                                    and manifest['cat_features'].
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')} (expected {MANIFEST_VERSION}).")
+
+    return {'numerical': np.load(os.path.join(path, NUMERICAL_FILE), mmap_mode=mmap_mode),
+            'categorical': np.load(os.path.join(path, CATEGORICAL_FILE), mmap_mode=mmap_mode),
+            'client_id': np.load(os.path.join(path, CLIENT_ID_FILE), mmap_mode=mmap_mode),
+            'target': np.load(os.path.join(path, TARGET_FILE), mmap_mode=mmap_mode),
+            'manifest': manifest,
+            }
+
+
+def model_matrix_to_frame(model_matrix: dict, decode_categories=True) -> pd.DataFrame:
+    """ Convert a loaded model matrix back to a DF with columns client_id, target, NUM_FEATURES, CAT_FEATURES
+        (same layout as 'df_model.csv'). Unlike load_model_matrix() this copies the data into memory.
+
+    Args:
+        model_matrix (dict):                Output of load_model_matrix().
+        decode_categories (bool, optional): Defaults to True to convert the int8 values/ codes to
+                                            categorical columns with the original levels.
+                                            Set to False to keep the int8 values/ codes.
+
+    Returns:
+        pd.DataFrame:                       Model DF.
+    """
+    manifest = model_matrix['manifest']
+
+    df_model = pd.DataFrame({manifest['client_id']: model_matrix['client_id'],
+                             manifest['target']: model_matrix['target']})
+    df_numerical = pd.DataFrame(np.asarray(model_matrix['numerical']), columns=manifest['num_features'])
+
+    categorical = np.asarray(model_matrix['categorical'])
+    if decode_categories:
+        columns = {}
+        for i, feature in enumerate(manifest['cat_features']):
+            levels = manifest['category_levels'][feature]
+            codes = categorical[:, i]
+            if manifest['category_encoding'][feature] == 'values':
+                # value -> position of the level (missing values stay -1)
+                lookup = np.full(np.iinfo(np.int8).max + 2, -1, dtype=np.int8)
+                lookup[integer_levels(levels)] = np.arange(len(levels))
+                codes = lookup[codes]
+            columns[feature] = pd.Categorical.from_codes(codes, levels)
+        df_categorical = pd.DataFrame(columns)
+    else:
+        df_categorical = pd.DataFrame(categorical, columns=manifest['cat_features'])
+
+    return pd.concat([df_model, df_numerical, df_categorical], axis=1)
@@ -0,0 +1,235 @@
+#####################################################
+### Feature screening for the wide feature matrix ### - univariate fraud relevance and redundancy
+#####################################################
+
+# Instead of selecting features by looking at the plots one by one, all candidate features
+# (e.g. from add_consumption_features() and create_mode_and_count_feature()) are ranked
+# by their relation to the target with batched matrix operations:
+#
+#   screen_features()       -> fraud rate lift, point-biserial correlation and mutual information (binned values)
+#   feature_redundancy()    -> pairs of highly correlated features (blocked correlation matrix)
+#   select_features()       -> NUM_FEATURES and CAT_FEATURES lists from the ranking
+
+
+import numpy as np
+import pandas as pd
+
+
+N_BINS = 10         # quantile bins for numerical features
+BLOCK_SIZE = 32     # number of columns processed at once
+MIN_BIN_SIZE = 100  # bins with fewer clients are ignored for the fraud rate lift
+
+
+def bin_features(values: np.ndarray, n_bins=N_BINS, block_size=BLOCK_SIZE) -> np.ndarray:
+    """ Assign each value to a quantile bin (0 to n_bins-1), column by column in blocks.
+        Tied values (e.g. many 0 consumptions) end up in the same bin.
+
+    Args:
+        values (np.ndarray):            2D array (clients x features) without missing values.
+        n_bins (int, optional):         Number of quantile bins. Defaults to N_BINS.
+        block_size (int, optional):     Number of columns binned at once. Defaults to BLOCK_SIZE.
+
+    Returns:
+        np.ndarray:                     2D int array with the bin of each value.
+    """
+    # rows of the sorted values at the inner quantiles (bin edges)
+    edge_rows = (np.linspace(0, 1, n_bins + 1)[1:-1] * (len(values) - 1)).astype(int)
+
+    bins = np.empty(values.shape, dtype=np.int16)
+    for start in range(0, values.shape[1], block_size):
+        block = values[:, start:start + block_size]
+        edges = np.sort(block, axis=0)[edge_rows].T  # features x (n_bins - 1)
+        bins[:, start:start + block_size] = (block[:, :, None] > edges[None, :, :]).sum(axis=2)
+
+    return bins
+
+
+def binned_relevance(bins: np.ndarray, y: np.ndarray, n_bins: int, min_bin_size=MIN_BIN_SIZE) -> tuple:
+    """ Compute the mutual information and fraud rate lift of binned features with the target.
+
+    Args:
+        bins (np.ndarray):              2D int array (clients x features) with bins 0 to n_bins-1.
+        y (np.ndarray):                 Target (1 = fraud, 0 = no fraud).
+        n_bins (int):                   Number of bins.
+        min_bin_size (int, optional):   Minimum number of clients in a bin for the lift. Defaults to MIN_BIN_SIZE.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray):  Mutual information (in nats) and lift (max. fraud rate of a bin / baseline)
+                                        for each feature.
+    """
+    n_rows, n_features = bins.shape
+
+    # joint counts (features x bins x target) with one bincount over all features
+    index = (np.arange(n_features)[None, :] * n_bins + bins) * 2 + y[:, None]
+    counts = np.bincount(index.ravel(), minlength=n_features * n_bins * 2).reshape(n_features, n_bins, 2)
+
+    # mutual information
+    p_joint = counts / n_rows
+    p_bin = p_joint.sum(axis=2, keepdims=True)
+    p_target = p_joint.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = p_joint * np.log(p_joint / (p_bin * p_target))
+    mutual_information = np.nansum(terms, axis=(1, 2))
+
+    # fraud rate lift
+    bin_size = counts.sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraud_rate = np.where(bin_size >= min_bin_size, counts[:, :, 1] / bin_size, np.nan)
+    lift = np.nanmax(np.where(np.isnan(fraud_rate), -np.inf, fraud_rate), axis=1) / y.mean()
+    lift[np.isinf(lift)] = np.nan
+
+    return mutual_information, lift
+
+
+#################
+### Screening ###
+#################
+
+
+def screen_features(data: pd.DataFrame,
+                    candidates=None,
+                    target='target',
+                    client_id='client_id',
+                    fill_value=0,
+                    n_bins=N_BINS,
+                    min_bin_size=MIN_BIN_SIZE) -> pd.DataFrame:
+    """ Rank all candidate features by their univariate relation to the target.
+        Categorical (non-numerical dtype, e.g. category, object or str) features are binned by their categories,
+        numerical features by quantiles.
+
+    Args:
+        data (pd.DataFrame):            DF with one row per client (e.g. df_merged).
+        candidates (list, optional):    Candidate features. Defaults to None (all columns except client_id and target).
+        target (str, optional):         Name of the target column. Defaults to 'target'.
+        client_id (str, optional):      Name of the client id column. Defaults to 'client_id'.
+        fill_value (int, optional):     Value to replace missing numerical values. Defaults to 0.
+        n_bins (int, optional):         Number of quantile bins for numerical features. Defaults to N_BINS.
+        min_bin_size (int, optional):   Minimum bin size for the lift. Defaults to MIN_BIN_SIZE.
+
+    Returns:
+        pd.DataFrame:                   One row per feature with columns 'feature', 'type' ('num' or 'cat'),
+                                        'mutual_information', 'correlation' (point-biserial, num only),
+                                        'lift', sorted by mutual information.
+    """
+    if candidates is None:
+        candidates = [column for column in data.columns if column not in [client_id, target]]
+
+    y = data[target].astype(int).to_numpy()
+    # non-numerical columns (category, object, str) are categorical, bool columns are numerical
+    cat_features = [feature for feature in candidates if not pd.api.types.is_numeric_dtype(data[feature])]
+    num_features = [feature for feature in candidates if feature not in cat_features]
+
+    results = []
+
+    if num_features:
+        values = data[num_features].astype(float).fillna(fill_value).to_numpy()
+
+        # point-biserial correlation = pearson correlation with the binary target (one matrix product)
+        centered = values - values.mean(axis=0)
+        y_centered = y - y.mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = (centered.T @ y_centered) / (np.sqrt((centered ** 2).sum(axis=0)) * np.sqrt((y_centered ** 2).sum()))
+
+        mutual_information, lift = binned_relevance(bin_features(values, n_bins), y, n_bins, min_bin_size)
+        results.append(pd.DataFrame({'feature': num_features, 'type': 'num', 'mutual_information': mutual_information,
+                                     'correlation': correlation, 'lift': lift}))
+
+    if cat_features:
+        codes = np.column_stack([data[feature].astype('category').cat.codes.to_numpy() for feature in cat_features])
+        codes = codes + 1  # missing values (-1) get their own bin 0
+        n_levels = int(codes.max()) + 1
+        mutual_information, lift = binned_relevance(codes, y, n_levels, min_bin_size)
+        results.append(pd.DataFrame({'feature': cat_features, 'type': 'cat', 'mutual_information': mutual_information,
+                                     'correlation': np.nan, 'lift': lift}))
+
+    ranking = pd.concat(results, ignore_index=True)
+
+    return ranking.sort_values('mutual_information', ascending=False, ignore_index=True)
+
+
+##################
+### Redundancy ###
+##################
+
+
+def feature_redundancy(data: pd.DataFrame, features: list, threshold=0.95, fill_value=0,
+                       block_size=256) -> pd.DataFrame:
+    """ Find pairs of numerical features with an absolute correlation above threshold.
+        The correlation matrix is computed block by block (block_size x block_size),
+        so the full matrix of all candidate features is never stored.
+
+    Args:
+        data (pd.DataFrame):            DF with the features.
+        features (list):                Numerical feature names.
+        threshold (float, optional):    Minimum absolute correlation of a redundant pair. Defaults to 0.95.
+        fill_value (int, optional):     Value to replace missing values. Defaults to 0.
+        block_size (int, optional):     Number of features per block. Defaults to 256.
+
+    Returns:
+        pd.DataFrame:                   Columns 'feature_1', 'feature_2' and 'correlation'.
+    """
+    values = data[features].astype(float).fillna(fill_value).to_numpy(dtype=np.float32)
+
+    # standardize, so the correlation is the matrix product divided by the number of clients
+    std = values.std(axis=0)
+    std[std == 0] = np.inf  # constant features have correlation 0
+    standardized = (values - values.mean(axis=0)) / std
+
+    pairs = []
+    n_features = len(features)
+    for i in range(0, n_features, block_size):
+        for j in range(i, n_features, block_size):
+            block = standardized[:, i:i + block_size].T @ standardized[:, j:j + block_size] / len(values)
+            rows, columns = np.nonzero(np.abs(block) > threshold)
+            for row, column in zip(rows, columns):
+                if i + row < j + column:  # upper triangle only
+                    pairs.append((features[i + row], features[j + column], float(block[row, column])))
+
+    return pd.DataFrame(pairs, columns=['feature_1', 'feature_2', 'correlation'])
+
+
+#################
+### Selection ###
+#################
+
+
+def select_features(ranking: pd.DataFrame, redundancy=None, min_mutual_information=0.001, min_lift=None,
+                    top_n=None) -> tuple:
+    """ Select NUM_FEATURES and CAT_FEATURES from the ranking of screen_features().
+        Going down the ranking, a feature is skipped when it is redundant with an already selected feature.
+
+    Args:
+        ranking (pd.DataFrame):                 Output of screen_features().
+        redundancy (pd.DataFrame, optional):    Output of feature_redundancy(). Defaults to None.
+        min_mutual_information (float, optional):   Minimum mutual information. Defaults to 0.001.
+        min_lift (float, optional):             Minimum lift. Defaults to None (no minimum).
+        top_n (int, optional):                  Maximum number of features. Defaults to None (no maximum).
+
+    Returns:
+        tuple(list, list):                      NUM_FEATURES and CAT_FEATURES.
+    """
+    candidates = ranking[ranking.mutual_information >= min_mutual_information]
+    if min_lift is not None:
+        candidates = candidates[candidates.lift >= min_lift]
+
+    # redundant partners of each feature
+    partners = {}
+    if redundancy is not None:
+        for row in redundancy.itertuples():
+            partners.setdefault(row.feature_1, set()).add(row.feature_2)
+            partners.setdefault(row.feature_2, set()).add(row.feature_1)
+
+    selected = []
+    num_features, cat_features = [], []
+    for row in candidates.itertuples():
+        if partners.get(row.feature, set()) & set(selected):
+            continue
+        selected.append(row.feature)
+        if row.type == 'num':
+            num_features.append(row.feature)
+        else:
+            cat_features.append(row.feature)
+        if top_n and len(selected) >= top_n:
+            break
+
+    return num_features, cat_features
@@ -0,0 +1,231 @@
+#############################################
+### Client-indexed columnar feature store ### - replaces repeated outer merges on client_id
+#############################################
+
+# df_merged grows with ~10 pd.merge(..., on='client_id', how='outer') calls,
+# each of them hashes the keys again and copies all existing columns.
+# The ClientFeatureStore has a fixed, sorted client_id index. New feature blocks
+# (e.g. the output of extract_account_duration() or create_mode_and_count_feature())
+# are aligned once by position and stored as separate columns, existing columns are not copied.
+# Any subset of columns can be materialized as DF or numpy matrix and the store can be saved to disk.
+#
+# Example:
+#   store = ClientFeatureStore(df_client['client_id'])
+#   store.add_block(df_client)
+#   store.add_block(features_account_dur)
+#   store.add_block(counter_code_features)
+#   df_model = store.to_frame(['target'] + NUM_FEATURES + CAT_FEATURES)
+
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILE = 'client_id.npy'
+
+
+def normalize_client_ids(client_ids) -> np.ndarray:
+    """ Convert client ids (int, str or category) to an int64 array,
+        or to a fixed-width str array if they are not all digits.
+    """
+    client_ids = pd.Series(client_ids).astype(str)
+    if client_ids.str.isdigit().all():
+        return client_ids.to_numpy(dtype=np.int64)
+
+    return np.asarray(client_ids, dtype=str)
+
+
+def empty_column(series: pd.Series, n_rows: int):
+    """ Return an array of length n_rows filled with missing values that can hold the values of series
+        (int and bool columns become float as with an outer merge).
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(np.full(n_rows, -1), dtype=series.dtype)
+
+    kind = np.dtype(series.dtype).kind if not pd.api.types.is_extension_array_dtype(series.dtype) else 'O'
+    if kind == 'f':
+        return np.full(n_rows, np.nan, dtype=series.dtype)
+    if kind in 'iub':
+        return np.full(n_rows, np.nan, dtype=np.float64)
+    if kind in 'mM':
+        return np.full(n_rows, np.datetime64('NaT') if kind == 'M' else np.timedelta64('NaT'), dtype=series.dtype)
+
+    return np.full(n_rows, None, dtype=object)
+
+
+class ClientFeatureStore:
+    """ Columnar feature store with a fixed, sorted client_id index (see module description).
+    """
+
+    def __init__(self, client_ids):
+        """
+        Args:
+            client_ids:     Client ids (e.g. df_client['client_id']), duplicates are removed.
+        """
+        self.client_ids = np.unique(normalize_client_ids(client_ids))
+        self.columns = {}   # column name -> array (np.ndarray or pd.Categorical) aligned to client_ids
+
+    def __len__(self) -> int:
+        return len(self.client_ids)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    @property
+    def column_names(self) -> list:
+        return list(self.columns.keys())
+
+    def add_block(self, block: pd.DataFrame, client_id='client_id', ignore_unknown=False) -> 'ClientFeatureStore':
+        """ Add all columns of a feature block (one row per client) to the store.
+            Existing columns with the same name are replaced.
+            Clients of the store that are not in the block get missing values (as with an outer merge).
+            Blocks with all clients of the store keep their dtypes (in any row order).
+
+        Args:
+            block (pd.DataFrame):               DF with column client_id and the new features.
+            client_id (str, optional):          Name of the client id column. Defaults to 'client_id'.
+            ignore_unknown (bool, optional):    Defaults to False to raise a ValueError for clients
+                                                that are not in the store. Set to True to drop them.
+
+        Returns:
+            ClientFeatureStore:                 The store itself (to chain calls).
+        """
+        keys = normalize_client_ids(block[client_id])
+
+        if len(np.unique(keys)) != len(keys):
+            raise ValueError(f'The column {client_id} of the feature block has duplicated values.')
+
+        # position of each row of the block in the client index
+        positions = np.searchsorted(self.client_ids, keys)
+        positions[positions == len(self.client_ids)] = 0
+        known = self.client_ids[positions] == keys
+        if not known.all():
+            if not ignore_unknown:
+                raise ValueError(f'{(~known).sum()} clients of the feature block are not in the feature store.')
+            positions = positions[known]
+
+        rows = np.flatnonzero(known)
+        # the block covers every client of the store (keys are unique): no missing values, the dtype is kept
+        complete = len(positions) == len(self.client_ids)
+        aligned = complete and known.all() and (positions == np.arange(len(positions))).all()
+        order = rows[np.argsort(positions)] if complete else None
+
+        for column in block.columns.drop(client_id):
+            series = block[column]
+            block_values = series.array if isinstance(series.dtype, pd.CategoricalDtype) else series.to_numpy()
+            if aligned:
+                # block is already in the order of the index: no copy needed
+                values = block_values
+            elif complete:
+                values = block_values[order]
+            else:
+                values = empty_column(series, len(self.client_ids))
+                values[positions] = block_values[rows]
+            self.columns[column] = values
+
+        return self
+
+    def to_frame(self, columns=None, client_id='client_id') -> pd.DataFrame:
+        """ Materialize columns of the store as DF (with the client ids as first column).
+
+        Args:
+            columns (list, optional):   Column names. Defaults to None (all columns).
+            client_id (str, optional):  Name of the client id column. Defaults to 'client_id'.
+                                        Set to None to leave out the client ids.
+
+        Returns:
+            pd.DataFrame:               One row per client (sorted by client id).
+        """
+        if columns is None:
+            columns = self.column_names
+
+        data = {client_id: self.client_ids} if client_id else {}
+        data.update({column: self.columns[column] for column in columns})
+
+        return pd.DataFrame(data, copy=False)
+
+    def to_numpy(self, columns: list, dtype=np.float32) -> np.ndarray:
+        """ Materialize columns of the store as 2D numpy array (clients x columns).
+            Categorical columns are converted to their category codes (-1 for missing values).
+
+        Args:
+            columns (list):             Column names, e.g. NUM_FEATURES + CAT_FEATURES.
+            dtype (optional):           Data type of the array. Defaults to np.float32.
+
+        Returns:
+            np.ndarray:                 Feature matrix.
+        """
+        matrix = np.empty((len(self.client_ids), len(columns)), dtype=dtype)
+        for i, column in enumerate(columns):
+            values = self.columns[column]
+            matrix[:, i] = values.codes if isinstance(values, pd.Categorical) else values
+
+        return matrix
+
+    ###################
+    ### Save and load ### - one .npy file per column and a manifest
+    ###################
+
+    def save(self, path: str):
+        """ Save the store to the folder 'path' (one .npy file per column, categories in manifest.json).
+            Object columns are saved as categories and codes, so missing values are kept.
+
+        Args:
+            path (str):     Output folder (created if it does not exist).
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, INDEX_FILE), self.client_ids)
+
+        manifest = {'version': MANIFEST_VERSION, 'columns': []}
+        for i, (column, values) in enumerate(self.columns.items()):
+            file_name = f'column_{i}.npy'
+            entry = {'name': column, 'file': file_name}
+            if not isinstance(values, pd.Categorical) and values.dtype == object:
+                # object arrays can not be memory-mapped: store as categories and codes (missing values = -1)
+                values = pd.Categorical(values)
+                entry['object'] = True
+            if isinstance(values, pd.Categorical):
+                entry['categories'] = [category.item() if isinstance(category, np.generic) else category
+                                       for category in values.categories]
+                entry['ordered'] = bool(values.ordered)
+                values = values.codes
+            np.save(os.path.join(path, file_name), values)
+            manifest['columns'].append(entry)
+
+        with open(os.path.join(path, MANIFEST_FILE), 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode='r') -> 'ClientFeatureStore':
+        """ Load a store saved with save(). With mmap_mode='r' the columns are memory-mapped (read only).
+
+        Args:
+            path (str):                 Folder of the saved store.
+            mmap_mode (str, optional):  Memory-map mode passed to np.load(). Defaults to 'r'.
+
+        Returns:
+            ClientFeatureStore:         Loaded store.
+        """
+        with open(os.path.join(path, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {manifest.get('version')} (expected {MANIFEST_VERSION}).")
+
+        store = cls.__new__(cls)
+        store.client_ids = np.load(os.path.join(path, INDEX_FILE))
+        store.columns = {}
+        for entry in manifest['columns']:
+            values = np.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode)
+            if 'categories' in entry:
+                values = pd.Categorical.from_codes(values, categories=entry['categories'], ordered=entry['ordered'])
+            if entry.get('object'):
+                values = np.asarray(values, dtype=object)
+            store.columns[entry['name']] = values
+
+        return store
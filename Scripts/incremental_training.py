@@ -0,0 +1,260 @@
+##########################################################################
+### Out-of-core (incremental) training on chunks of the model features ###
+##########################################################################
+
+# The model feature table ('df_model.csv') has hundreds of monthly consumption columns
+# and does not always fit in memory. The functions below stream the table from disk
+# in chunks, so memory is bounded by the chunk size and not by the size of the data set:
+#
+#   1) count_target_classes()       -> class counts for the fraud/ no fraud weighting
+#   2) fit_streaming_scaler()       -> StandardScaler fitted chunk by chunk with partial_fit()
+#   3) train_incremental_model()    -> any sklearn classifier with partial_fit() (e.g. SGDClassifier)
+#   4) evaluate_incremental_model() -> confusion matrix and F1 score accumulated over chunks
+
+
+import inspect
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+
+CHUNKSIZE = 50_000  # rows per chunk (default)
+CLASSES = np.array([0, 1])  # no fraud (0) and fraud (1)
+
+
+######################
+### Reading chunks ###
+######################
+
+
+def read_feature_chunks(path: str, columns: list, chunksize=CHUNKSIZE):
+    """ Read the columns of a feature csv file chunk by chunk.
+
+    Args:
+        path (str):                 Path to the csv file with the model features (e.g. 'df_model.csv').
+        columns (list):             Column names to read.
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+
+    Yields:
+        pd.DataFrame:               Chunk with the selected columns.
+    """
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+        yield chunk
+
+
+def prepare_chunk(chunk: pd.DataFrame, features: list, scaler=None, fill_value=0, target='target') -> tuple:
+    """ Split a chunk into the feature matrix X (float32) and the target vector y.
+        Missing values (e.g. clients without gas account) are filled with fill_value
+        and the features are optionally scaled.
+
+    Args:
+        chunk (pd.DataFrame):           Chunk with the feature and target columns.
+        features (list):                Feature names in the order used for modelling.
+                                        Categorical (risk) features have to be numerical codes.
+        scaler (optional):              Fitted scaler with a transform() method. Defaults to None.
+        fill_value (int, optional):     Value to replace missing values. Defaults to 0.
+        target (str, optional):         Name of the target column. Defaults to 'target'.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray):  X (float32) and y (int) of the chunk.
+    """
+    X = chunk[features].fillna(fill_value).to_numpy(dtype=np.float32)
+    if scaler is not None:
+        X = scaler.transform(X).astype(np.float32, copy=False)
+    y = chunk[target].to_numpy(dtype=int)
+
+    return X, y
+
+
+###############################
+### Streaming preprocessing ### - class weights and feature scaling
+###############################
+
+
+def count_target_classes(path: str, target='target', chunksize=CHUNKSIZE) -> dict:
+    """ Count the number of clients per target class (fraud/ no fraud) in one pass over the file.
+
+    Args:
+        path (str):                 Path to the feature csv file.
+        target (str, optional):     Name of the target column. Defaults to 'target'.
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+
+    Returns:
+        dict:                       Class as key and number of clients as value, e.g. {0: 127927, 1: 7566}.
+    """
+    class_counts = {}
+    for chunk in read_feature_chunks(path, [target], chunksize):
+        for label, count in chunk[target].value_counts().items():
+            class_counts[int(label)] = class_counts.get(int(label), 0) + int(count)
+
+    return class_counts
+
+
+def compute_class_weights(class_counts: dict) -> dict:
+    """ Compute 'balanced' class weights n_samples / (n_classes * n_class_samples)
+        from the class counts, the same formula sklearn uses for class_weight='balanced'.
+
+    Args:
+        class_counts (dict):    Class as key and number of samples as value.
+
+    Returns:
+        dict:                   Class as key and weight as value.
+                                The minority class (fraud) gets the higher weight.
+    """
+    n_samples = sum(class_counts.values())
+    n_classes = len(class_counts)
+
+    return {label: n_samples / (n_classes * count) for label, count in class_counts.items()}
+
+
+def fit_streaming_scaler(path: str, features: list, chunksize=CHUNKSIZE, fill_value=0) -> StandardScaler:
+    """ Fit a StandardScaler chunk by chunk (partial_fit) on the features of a csv file.
+
+    Args:
+        path (str):                 Path to the feature csv file.
+        features (list):            Feature names to scale.
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+        fill_value (int, optional): Value to replace missing values. Defaults to 0.
+
+    Returns:
+        StandardScaler:             Scaler fitted on all rows of the file.
+    """
+    scaler = StandardScaler()
+    for chunk in read_feature_chunks(path, features, chunksize):
+        scaler.partial_fit(chunk[features].fillna(fill_value).to_numpy(dtype=np.float32))
+
+    return scaler
+
+
+######################
+### Model training ### - incremental learning with partial_fit()
+######################
+
+
+def train_incremental_model(path: str,
+                            features: list,
+                            model=None,
+                            scaler=None,
+                            class_weights=None,
+                            n_epochs=1,
+                            chunksize=CHUNKSIZE,
+                            target='target',
+                            random_state=42,
+                            verbose=False):
+    """ Train a classifier incrementally on a feature csv file that is streamed in chunks.
+        Fraud cases are the minority class, so each sample is weighted with its class weight.
+
+    Args:
+        path (str):                     Path to the feature csv file.
+        features (list):                Feature names used for modelling (e.g. NUM_FEATURES + CAT_FEATURES).
+        model (optional):               Sklearn classifier with a partial_fit() method.
+                                        Defaults to None, which creates an SGDClassifier (logistic regression).
+        scaler (optional):              Fitted scaler (see fit_streaming_scaler()). Defaults to None.
+        class_weights (dict, optional): Class as key and weight as value (see compute_class_weights()).
+                                        Defaults to None (no weighting).
+        n_epochs (int, optional):       Number of passes over the file. Defaults to 1.
+        chunksize (int, optional):      Number of rows per chunk. Defaults to CHUNKSIZE.
+        target (str, optional):         Name of the target column. Defaults to 'target'.
+        random_state (int, optional):   Seed used to shuffle the rows within each chunk. Defaults to 42.
+        verbose (bool, optional):       Set to True to print the progress per epoch. Defaults to False.
+
+    Returns:
+        Fitted model.
+    """
+    if model is None:
+        model = SGDClassifier(loss='log_loss', random_state=random_state)
+
+    if not hasattr(model, 'partial_fit'):
+        raise TypeError(f"Invalid model type: {type(model).__name__}. The model must have a partial_fit() method.")
+
+    weighted = class_weights is not None
+    if weighted and 'sample_weight' not in inspect.signature(model.partial_fit).parameters:
+        raise TypeError(f"{type(model).__name__}.partial_fit() does not support sample weights. Set class_weights=None.")
+
+    rng = np.random.default_rng(random_state)
+
+    for epoch in range(n_epochs):
+        n_rows = 0
+        for chunk in read_feature_chunks(path, features + [target], chunksize):
+            X, y = prepare_chunk(chunk, features, scaler, target=target)
+
+            # shuffle rows within the chunk (the file might be sorted by client_id or target)
+            order = rng.permutation(len(y))
+            X, y = X[order], y[order]
+
+            if weighted:
+                sample_weight = np.array([class_weights[label] for label in CLASSES])[y]
+                model.partial_fit(X, y, classes=CLASSES, sample_weight=sample_weight)
+            else:
+                model.partial_fit(X, y, classes=CLASSES)
+            n_rows += len(y)
+
+        if verbose:
+            print(f'Epoch {epoch + 1}/{n_epochs}: trained on {n_rows} clients.')
+
+    return model
+
+
+########################
+### Model evaluation ### - accumulated over chunks
+########################
+
+
+def evaluate_incremental_model(path: str,
+                               features: list,
+                               model,
+                               scaler=None,
+                               chunksize=CHUNKSIZE,
+                               target='target',
+                               verbose=True) -> dict:
+    """ Evaluate a fitted classifier on a feature csv file that is streamed in chunks.
+        The confusion matrix is summed up over all chunks and the scores are computed from it.
+
+    Args:
+        path (str):                 Path to the feature csv file (e.g. the test set).
+        features (list):            Feature names used for training (same order).
+        model:                      Fitted sklearn classifier.
+        scaler (optional):          Scaler used for training. Defaults to None.
+        chunksize (int, optional):  Number of rows per chunk. Defaults to CHUNKSIZE.
+        target (str, optional):     Name of the target column. Defaults to 'target'.
+        verbose (bool, optional):   Defaults to True. If False no summary is printed.
+
+    Returns:
+        dict:                       'confusion_matrix' (rows: true, columns: predicted),
+                                    'precision', 'recall', 'f1' of the fraud class and
+                                    'f1_macro' (mean F1 of both classes in percent).
+    """
+    cm = np.zeros((len(CLASSES), len(CLASSES)), dtype=np.int64)
+
+    for chunk in read_feature_chunks(path, features + [target], chunksize):
+        X, y = prepare_chunk(chunk, features, scaler, target=target)
+        y_pred = model.predict(X).astype(int)
+        # add the confusion matrix of the chunk (index = true * n_classes + predicted)
+        cm += np.bincount(y * len(CLASSES) + y_pred, minlength=cm.size).reshape(cm.shape)
+
+    # F1 score for each class from the confusion matrix
+    true_positive = np.diag(cm).astype(float)
+    predicted = cm.sum(axis=0)
+    actual = cm.sum(axis=1)
+    precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+    recall = np.divide(true_positive, actual, out=np.zeros_like(true_positive), where=actual > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(true_positive), where=(precision + recall) > 0)
+
+    scores = {'confusion_matrix': cm,
+              'precision': precision[1],
+              'recall': recall[1],
+              'f1': f1[1],
+              'f1_macro': f1.mean() * 100,
+              }
+
+    if verbose:
+        print("------"*10)
+        print("Confusion Matrix: \n", cm)
+        print("------"*10)
+        print(f"Fraud precision: {round(scores['precision'], 2)}, recall: {round(scores['recall'], 2)}")
+        print(f"F1_Score: {round(scores['f1_macro'], 0)}")
+
+    return scores
@@ -0,0 +1,226 @@
+##########################################################
+### On-disk memoization of preprocessing/ aggregations ### - content-addressed, LRU eviction by size
+##########################################################
+
+# Re-running notebook cells recomputes expensive aggregations of the invoice data
+# (e.g. create_mode_and_count_feature(), extract_account_duration(), calculate_energy_consumption())
+# even when the inputs have not changed.
+# The memoize() decorator stores the result on disk under a key that is a hash of
+#   - the function (name and source code of its module, so changes of called helpers are included),
+#   - the content of the input columns the function actually uses,
+#   - all other arguments.
+# Results are stored with pandas' binary pickle format (column blocks, no text parsing).
+# A result is written to a temporary file first and then renamed, so an interrupted write leaves no broken entry.
+# When the cache is larger than max_bytes, the least recently used results are deleted.
+#
+# Cached versions of the functions from preprocessing.py and plotting.py are defined at the bottom:
+#   from memoization import cached_create_mode_and_count_feature
+#   counter_code_features = cached_create_mode_and_count_feature(df_invoice, 'counter_code', 'counter_code')
+#
+# Only functions that do not change their input DF in place are cached.
+
+
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+
+import pandas as pd
+
+import plotting
+import preprocessing
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache')
+MAX_CACHE_BYTES = 2 * 1024**3  # 2 GB
+CACHE_SUFFIX = '.pkl'
+
+
+###############
+### Hashing ###
+###############
+
+
+def hash_dataframe(data: pd.DataFrame, columns=None) -> str:
+    """ Fast content hash of the columns of a DF (values, index, column names and dtypes).
+
+    Args:
+        data (pd.DataFrame):        Input DF.
+        columns (list, optional):   Columns to hash. Defaults to None (all columns).
+
+    Returns:
+        str:                        Hex digest.
+    """
+    if columns is not None:
+        data = data[columns]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(column, str(dtype)) for column, dtype in data.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def function_source(func) -> str:
+    """ Return the source code of the module of a function (incl. the helpers it calls),
+        or of the function itself when the module has no source file (e.g. defined in a notebook).
+        Without any source, the byte code and constants of the function are used.
+    """
+    for source_of in [inspect.getmodule(func), func]:
+        try:
+            return inspect.getsource(source_of)
+        except (OSError, TypeError):
+            continue
+
+    return repr((func.__code__.co_code, func.__code__.co_consts))
+
+
+def make_cache_key(func, bound_args: dict, columns: dict) -> str:
+    """ Create the cache key of a function call.
+
+    Args:
+        func:                   Cached function.
+        bound_args (dict):      Argument name -> value of the call (incl. defaults).
+        columns (dict):         Argument name -> list of used columns (or callable(bound_args) -> list)
+                                for DF arguments.
+
+    Returns:
+        str:                    Hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{func.__module__}.{func.__qualname__}'.encode())
+    digest.update(function_source(func).encode())
+
+    for name, value in bound_args.items():
+        digest.update(name.encode())
+        if isinstance(value, pd.DataFrame):
+            used_columns = columns.get(name)
+            if callable(used_columns):
+                used_columns = used_columns(bound_args)
+            digest.update(hash_dataframe(value, used_columns).encode())
+        else:
+            digest.update(repr(value).encode())
+
+    return digest.hexdigest()
+
+
+#############
+### Cache ###
+#############
+
+
+def cache_size(cache_dir=CACHE_DIR) -> int:
+    """ Return the size of all cached results in bytes.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(CACHE_SUFFIX))
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """ Delete the least recently used results until the cache is not larger than max_bytes.
+        The modification time of a result is updated when it is read (see memoize()).
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = sorted((entry for entry in os.scandir(cache_dir) if entry.name.endswith(CACHE_SUFFIX)),
+                     key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """ Delete all cached results.
+    """
+    evict_cache(cache_dir, max_bytes=0)
+
+
+def memoize(columns=None, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """ Decorator that caches the results of a function on disk (see module description).
+
+    Args:
+        columns (dict, optional):       Argument name -> columns that the function uses from this DF argument,
+                                        either a list or a callable(bound_args) -> list.
+                                        Defaults to None (all columns of DF arguments are hashed).
+        cache_dir (str, optional):      Folder of the cache. Defaults to CACHE_DIR.
+        max_bytes (int, optional):      Maximum size of the cache. Defaults to MAX_CACHE_BYTES.
+
+    Returns:
+        Decorator.
+    """
+    columns = columns or {}
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            path = os.path.join(cache_dir, make_cache_key(func, bound.arguments, columns) + CACHE_SUFFIX)
+
+            if os.path.exists(path):
+                os.utime(path)  # mark as recently used
+                return pd.read_pickle(path)
+
+            result = func(*args, **kwargs)
+
+            os.makedirs(cache_dir, exist_ok=True)
+            file, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            os.close(file)
+            try:
+                pd.to_pickle(result, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            evict_cache(cache_dir, max_bytes)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+########################
+### Cached functions ### - from preprocessing.py and plotting.py
+########################
+
+
+cached_extract_account_duration = memoize(
+    columns={'df_by_counter_type': ['client_id', 'invoice_date']}
+    )(preprocessing.extract_account_duration)
+
+cached_create_mode_feature = memoize(
+    columns={'invoice_data': lambda args: ['client_id', args['feature']]}
+    )(preprocessing.create_mode_feature)
+
+cached_create_count_feature = memoize(
+    columns={'invoice_data': lambda args: ['client_id', args['feature']]}
+    )(preprocessing.create_count_feature)
+
+cached_create_mode_and_count_feature = memoize(
+    columns={'invoice_data': lambda args: ['client_id', args['feature']]}
+    )(preprocessing.create_mode_and_count_feature)
+
+cached_calculate_energy_consumption = memoize(
+    columns={'data': lambda args: ['client_id', 'invoice_month', f"consumption_lvl_{args['consumption_level']}"]}
+    )(preprocessing.calculate_energy_consumption)
+
+cached_aggregate_feature_by_target = memoize(
+    columns={'data_df': lambda args: [args['feature'], args['target']] if args['target'] else [args['feature']]}
+    )(plotting.aggregate_feature_by_target)
+
+cached_aggregate_monthly_consumption = memoize(
+    columns={'data': lambda args: ['target'] + [f"{args['energy_type']}_{args['consumption_level']}_mon_{month}_mean"
+                                                for month in range(1, 13)]}
+    )(plotting.aggregate_monthly_consumption)
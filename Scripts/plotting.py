@@ -3,10 +3,14 @@
 ################################################################
 
 
+import colorsys
+
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib
+from matplotlib import cbook
 
 
 #################
@@ -26,6 +30,21 @@ def max_min_range(x) -> float:
 max_min_range.__name__ = 'max_min_range'
 
 
+# display the current figure or save it to a file (for batch export, see report_figures.py)
+def show_or_save(save_path=None):
+    """ Show the current figure with plt.show(), or save it to save_path and close it.
+
+    Args:
+        save_path (str, optional):  Path of the image file, e.g. '../Images/pie_plot_fraud_rate.png'.
+                                    Defaults to None (show the figure).
+    """
+    if save_path:
+        plt.savefig(save_path, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
+
+
 ################
 ### pie plot ### - used to show the fraud rate 
 ################
@@ -48,15 +67,21 @@ def get_fraud_proportion(client_data: pd.DataFrame) -> float:
     return fraud_proportion.values[0]
 
 
-def create_fraud_freq_pieplot(client_data):
+def create_fraud_freq_pieplot(client_data, fraud_proportion=None, save_path=None):
     """ Create a pretty pie plot displaying the frequency of fraud
         in energy consumption.
 
     Args:
-        client_data (pd.DataFrame): df with column named 'target' 
-                                    that has the categories 0 and 1
+        client_data (pd.DataFrame):         df with column named 'target' 
+                                            that has the categories 0 and 1
+        fraud_proportion (float, optional): Precomputed fraud proportion (see get_fraud_proportion()).
+                                            Defaults to None (computed from client_data).
+        save_path (str, optional):          Save the plot to this file instead of showing it. Defaults to None.
     """
-    fr = get_fraud_proportion(client_data)
+    if fraud_proportion is None:
+        fr = get_fraud_proportion(client_data)
+    else:
+        fr = fraud_proportion
     
     y = [100-fr, fr]                    # percent of normal and fraudulent clients
     pie_labels = ['normal', 'fraud']
@@ -69,7 +94,7 @@ def create_fraud_freq_pieplot(client_data):
             )
     
     plt.title('Frequency of gas and electricity fraud in Tunisia')
-    plt.show()
+    show_or_save(save_path)
 
 
 ##################################################
@@ -125,7 +150,8 @@ def subplopts_fraud_per_category(your_df:pd.DataFrame,
                                 fraud_baseline: float, 
                                 fraud_range: int | float,
                                 target='target', 
-                                verbose=False) -> pd.DataFrame: 
+                                verbose=False,
+                                save_path=None) -> pd.DataFrame: 
     """ This function creates 2 subplots of a categorical variable, grouped by the target.
         An new feature "fraud_risk" (low, normal, high) is determined by comparing the fraud risk 
         in all categories to the fraud_baseline.
@@ -142,6 +168,7 @@ def subplopts_fraud_per_category(your_df:pd.DataFrame,
                                     fraud / no fraud destinction.                              
         verbose (bool, optional):   Defaults to False. 
                                     Set to True to print additional info about new risk categories.
+        save_path (str, optional):  Save the plot to this file instead of showing it. Defaults to None.
                                 
     Returns:
         pd.Dataframe:                   Aggregated data frame grouped by target and category, 
@@ -233,7 +260,7 @@ def subplopts_fraud_per_category(your_df:pd.DataFrame,
             # axes[i].tick_params(axis='x', labelrotation=45)
             axes[i].set_xticks(axes[i].get_xticks(), axes[i].get_xticklabels(), rotation=45, ha='center')
 
-    plt.show()
+    show_or_save(save_path)
 
     #################################
     ### Optional print statements ### showing proportion of new fraud risk categories
@@ -251,12 +278,68 @@ def subplopts_fraud_per_category(your_df:pd.DataFrame,
     return grouped_df, fraud_risk_categories
 
 
+######################################
+### box plot statistics per target ### - computed once, drawn with ax.bxp()
+######################################
+
+# The boxplot functions below draw precomputed statistics, so only the small statistics
+# (and not the data of all clients) are needed to draw them (see report_figures.py).
+
+
+def calculate_box_stats(data: pd.DataFrame, column: str, target='target', show_outliers=True) -> list:
+    """ Calculate the box plot statistics of a column for each target group (no fraud, fraud):
+        median, quartiles, whiskers (1.5 IQR), notch confidence interval and outliers.
+
+    Args:
+        data (pd.DataFrame):            DF with the column and the target.
+        column (str):                   Name of the numerical column.
+        target (str, optional):         Defaults to 'target'.
+        show_outliers (bool, optional): Defaults to True. When False the outliers are not kept.
+
+    Returns:
+        list:                           One dict per target group (0, 1) as used by ax.bxp().
+    """
+    box_stats = []
+    for target_value in [0, 1]:
+        values = data.loc[data[target].astype(int) == target_value, column].dropna().to_numpy(dtype=float)
+        stats = cbook.boxplot_stats(values, whis=1.5)[0]
+        if not show_outliers:
+            stats['fliers'] = np.array([])
+        box_stats.append(stats)
+
+    return box_stats
+
+
+def draw_target_boxplots(ax, box_stats: list, show_outliers=True):
+    """ Draw the box plots of both target groups (left: no fraud, right: fraud) from calculate_box_stats()
+        in the style of sns.boxplot(hue='target', gap=0.2, width=.5, linewidth=1.5, notch=True).
+    """
+    colors = [COLOR_1, RED_COLORS[1]]
+    # dark gray for the lines (as seaborn)
+    lightness = min(colorsys.rgb_to_hls(*matplotlib.colors.to_rgb(color))[1] for color in colors) * .6
+    line_color = matplotlib.colors.rgb2hex((lightness, lightness, lightness))
+    line_props = {'color': line_color, 'linewidth': 1.5}
+
+    artists = ax.bxp(box_stats, positions=[-0.125, 0.125], widths=0.2, shownotches=True,
+                     showfliers=show_outliers, patch_artist=True,
+                     boxprops={'edgecolor': line_color, 'linewidth': 1.5},
+                     whiskerprops=line_props, capprops=line_props, medianprops=line_props,
+                     flierprops={'marker': 'o', 'markerfacecolor': 'none', 'markeredgecolor': line_color})
+
+    for box, color, label in zip(artists['boxes'], colors, ['0', '1']):
+        box.set_facecolor(sns.desaturate(color, 0.75))
+        box.set_label(label)
+    ax.set_xlim(-0.5, 0.5)
+
+
+
 ###################################################
 ### 1x4 grid of boxplots for energy consumption ### - grouped by consumption level and target
 ###################################################
 
 
-def boxplot_consumption_per_level(data:pd.DataFrame, energy_type: str, feature: str, show_outliers=True):
+def boxplot_consumption_per_level(data:pd.DataFrame, energy_type: str, feature: str, show_outliers=True, save_path=None,
+                                  box_stats=None):
     """ Create boxplots to display energy consumption grouped by target (fraud, no fraud) 
         and with a subplot for each level 1 to 4. 
     
@@ -267,6 +350,9 @@ def boxplot_consumption_per_level(data:pd.DataFrame, energy_type: str, feature:
         feature (str):          The aggregated energy consumption feature, e.g. 'mean', 'std', 'max_min_range'.
         show_outliers (bool):   Defaults to True to show ouliers in boxplots, 
                                 When False it will not display outliers in boxplots. 
+        save_path (str):        Save the plot to this file instead of showing it. Defaults to None.
+        box_stats (list):       Precomputed output of calculate_box_stats() for level 1 to 4.
+                                Defaults to None (calculated from data).
 
     """
 
@@ -289,15 +375,14 @@ def boxplot_consumption_per_level(data:pd.DataFrame, energy_type: str, feature:
     fig.suptitle(f'\n{consumption_label.title()} consumption by level {title_info}', fontsize=16, verticalalignment='center')
 
     for subplot in range(0,4):
-        sns.boxplot(ax=axes[subplot], 
-                    data=data, y=f'{energy_type}_{subplot + 1}_{feature}', 
-                    hue='target', palette=[COLOR_1, RED_COLORS[1]], 
-                    gap=0.2, width=.5, linewidth=1.5, notch=True,
-                    showfliers=show_outliers,
-                    )
+        # box plot statistics (unless they are precomputed)
+        if box_stats is None:
+            stats = calculate_box_stats(data, f'{energy_type}_{subplot + 1}_{feature}', show_outliers=show_outliers)
+        else:
+            stats = box_stats[subplot]
+        draw_target_boxplots(axes[subplot], stats, show_outliers=show_outliers)
         
         axes[subplot].set_title(f' Level {subplot +1 }', fontsize=9)
-        axes[subplot].legend([],[], frameon=False)  # remove legend
         axes[subplot].set_xticks([])                # remove xticks
 
         if subplot == 0:
@@ -318,7 +403,58 @@ def boxplot_consumption_per_level(data:pd.DataFrame, energy_type: str, feature:
     # adjustment with [left bottom, right, top] in normalized (0,1) space
     # increase top value to reduce space between top figures and suptitle (that is created when customizing the legend)
     
-    plt.show()
+    show_or_save(save_path)
+    return
+
+
+##################################################
+### 1x3 grid of boxplots for account durations ### - grouped by target
+##################################################
+
+
+def boxplot_account_duration(data: pd.DataFrame, save_path=None, box_stats=None):
+    """ Create boxplots to display the electricity and gas account durations and their difference
+        grouped by target (fraud, no fraud).
+
+    Args:
+        data (pd.DataFrame):        DF with columns 'elec_acc_dur_days', 'gas_acc_dur_days',
+                                    'difference_acc_dur' and 'target'.
+        save_path (str, optional):  Save the plot to this file instead of showing it. Defaults to None.
+        box_stats (list, optional): Precomputed output of calculate_box_stats() for the 3 features.
+                                    Defaults to None (calculated from data).
+    """
+    fig, axes = plt.subplots(1, 3, figsize=(12,5), gridspec_kw={'width_ratios': [1, 1, 1]}, sharey=True)
+    fig.suptitle(f'\nRelation between energy consumption behaviour and account duration', fontsize=16, verticalalignment='center')
+
+    features = ['elec_acc_dur_days', 'gas_acc_dur_days', 'difference_acc_dur']
+    y_labels = ['Electricity account duration','Gas account duration' , 'Difference in durations']
+
+    for subplot in range(0,3):
+        if box_stats is None:
+            stats = calculate_box_stats(data, features[subplot])
+        else:
+            stats = box_stats[subplot]
+        draw_target_boxplots(axes[subplot], stats)
+
+        axes[subplot].set_title(y_labels[subplot])
+        axes[subplot].set_xticks([])                # remove xticks
+
+        if subplot == 0:
+            axes[subplot].set_ylabel('Days')
+        else:
+            axes[subplot].set_ylabel('')
+
+        if subplot == 2: # add custom legend to last subplot (and don't forget to change plt.tight_layout() accordingly!)
+            legend_handles, _= axes[subplot].get_legend_handles_labels()
+            axes[subplot].legend(legend_handles, ['normal', 'fraud'])
+            sns.move_legend(axes[subplot],
+                            title='Consumption',
+                            bbox_to_anchor=(1.02, 1.3),
+                            loc='upper right')
+
+    plt.tight_layout(rect=[0, 0.03, 1, 1.15])
+
+    show_or_save(save_path)
     return
 
 
@@ -390,7 +526,8 @@ def calculate_error_bar_bounds(y: pd.Series, error: pd.Series, limit=True)->tupl
     return lower, upper
 
 
-def plot_monthly_consumption(data_df: pd.DataFrame, energy_type: str, metric: str, error_metric='std'):
+def plot_monthly_consumption(data_df: pd.DataFrame, energy_type: str, metric: str, error_metric='std',
+                             aggregated_data=None, save_path=None):
     """ In a 2x2 grid of subplots display the energy consumption (of a specific type 'elec' or 'gas') 
         for each level 1 to 4. Data is gropued by month and target (fraud/ no fraud).
 
@@ -400,6 +537,9 @@ def plot_monthly_consumption(data_df: pd.DataFrame, energy_type: str, metric: st
         energy_type (str):              Has to be 'elec' or 'gas'.
         metric (str):                   Metric used for data aggregation: 'mean'
         error_metric (str, optional):   Metric used to create error bands. Defaults to 'std'.
+        aggregated_data (list, optional):   Precomputed output of aggregate_monthly_consumption() for level 1 to 4.
+                                        Defaults to None (aggregated from data_df).
+        save_path (str, optional):      Save the plot to this file instead of showing it. Defaults to None.
     """
     #  energy type 'elec' or 'gas' has to be chosen
 
@@ -423,8 +563,11 @@ def plot_monthly_consumption(data_df: pd.DataFrame, energy_type: str, metric: st
 
     for subplot in range(0,4):
 
-        # aggregate the data
-        data = aggregate_monthly_consumption(data_df, energy_type, consumption_level=subplot+1)
+        # aggregate the data (unless it is precomputed)
+        if aggregated_data is None:
+            data = aggregate_monthly_consumption(data_df, energy_type, consumption_level=subplot+1)
+        else:
+            data = aggregated_data[subplot]
 
         sns.lineplot(ax=axes[axes_ref[subplot][0]][axes_ref[subplot][1]], 
                     data=data, x='months', y=metric, 
@@ -477,5 +620,5 @@ def plot_monthly_consumption(data_df: pd.DataFrame, energy_type: str, metric: st
     # adjustment with [left bottom, right, top] in normalized (0,1) space
     # increase top to reduce space between top figures and suptitle (that is created when customizing the legend)
     
-    plt.show()
+    show_or_save(save_path)
     return
\ No newline at end of file
@@ -3,6 +3,7 @@
 ############################################################################
 
 
+import numpy as np
 import pandas as pd
 
 
@@ -68,6 +69,69 @@ def add_feature_to_list(feature_name: str | list, feature_list: list) -> list:
     return feature_list
 
 
+##########################################
+### Decode dates and calendar features ### - e.g. invoice_year, invoice_month, ...
+##########################################
+
+# there are only a few thousand distinct dates in millions of rows:
+# each unique date string is parsed once and the results are mapped back by code
+
+# calendar components and their (compact) data types
+DATE_COMPONENTS = {'year': 'int16',
+                   'month': 'int8',
+                   'weekday': 'int8',  # Monday = 0, Sunday = 6
+                   'day': 'int8',
+                   }
+
+
+def extract_date_features(data: pd.DataFrame,
+                          date_column: str,
+                          prefix: str,
+                          components=('year', 'month', 'weekday', 'day'),
+                          dayfirst=False,
+                          date_format=None,
+                          drop=False) -> pd.DataFrame:
+    """ Parse the column date_column (str or datetime) and add a column prefix + '_' + component
+        for each calendar component, e.g. 'invoice_year', 'invoice_month', 'invoice_weekday', 'invoice_day'.
+        Each unique date is parsed only once, so no parse_dates is needed in pd.read_csv().
+        Missing dates are coded as -1 in the calendar columns.
+
+    Args:
+        data (pd.DataFrame):            DF with column date_column.
+        date_column (str):              Name of the date column, e.g. 'invoice_date' or 'creation_date'.
+        prefix (str):                   Prefix of the new columns, e.g. 'invoice' or 'acc_creation'.
+        components (tuple, optional):   Calendar components from DATE_COMPONENTS.
+                                        Defaults to ('year', 'month', 'weekday', 'day').
+        dayfirst (bool, optional):      Passed to pd.to_datetime(). Defaults to False.
+                                        (client data: True, invoice data: False)
+        date_format (str, optional):    Date format passed to pd.to_datetime(). Defaults to None.
+        drop (bool, optional):          Defaults to False to replace date_column with the parsed dates.
+                                        Set to True to drop date_column.
+
+    Returns:
+        pd.DataFrame:                   Input df with the new calendar columns.
+    """
+    # codes refer to the position in unique_dates (-1 for missing values)
+    codes, unique_dates = pd.factorize(data[date_column])
+    parsed_dates = pd.DatetimeIndex(pd.to_datetime(unique_dates, dayfirst=dayfirst, format=date_format))
+
+    for component in components:
+        if component == 'weekday':
+            values = parsed_dates.dayofweek
+        else:
+            values = getattr(parsed_dates, component)
+        # append -1 as last element, selected by the code -1 (missing date)
+        lookup = np.append(values.to_numpy(), -1).astype(DATE_COMPONENTS[component])
+        data[f'{prefix}_{component}'] = lookup[codes]
+
+    if drop:
+        data.drop(date_column, axis=1, inplace=True)
+    else:
+        data[date_column] = parsed_dates.take(codes, allow_fill=True, fill_value=pd.NaT)
+
+    return data
+
+
 #######################################
 ### Create account duration feature ### from the client's invoice data
 #######################################
@@ -281,6 +345,109 @@ def create_mode_and_count_feature(invoice_data: pd.DataFrame, feature: str, rena
     return feature_df
 
 
+###########################################
+### Handle outliers in consumption data ### - per client and level (before calculate_energy_consumption())
+###########################################
+
+# robust statistics (median and MAD, or IQR) of each client's readings are computed
+# with groupby().transform() for all levels at once (no groupby().apply() per client)
+
+# default thresholds: robust z-score for 'mad', multiple of the IQR for 'iqr'
+OUTLIER_THRESHOLDS = {'mad': 3.5, 'iqr': 1.5}
+
+
+def calculate_outlier_bounds(values: pd.DataFrame, groups: pd.Series, method='mad', threshold=None) -> tuple:
+    """ Calculate the lower and upper bound for outliers of each value based on the robust statistics of its group.
+
+    Args:
+        values (pd.DataFrame):          Numerical columns, e.g. consumption_lvl_1 to consumption_lvl_4.
+        groups (pd.Series):             Group of each row, e.g. 'client_id'.
+        method (str, optional):         'mad' (median +/- threshold * MAD / 0.6745) or
+                                        'iqr' (Q1 - threshold * IQR, Q3 + threshold * IQR). Defaults to 'mad'.
+        threshold (float, optional):    Defaults to None (OUTLIER_THRESHOLDS of the method).
+
+    Returns:
+        tuple(pd.DataFrame, pd.DataFrame):  Lower and upper bounds (same shape as values).
+    """
+    if threshold is None:
+        threshold = OUTLIER_THRESHOLDS[method]
+    grouped = values.groupby(groups, observed=True, sort=False)
+
+    if method == 'mad':
+        median = grouped.transform('median')
+        abs_deviation = (values - median).abs()
+        mad = abs_deviation.groupby(groups, observed=True, sort=False).transform('median')
+        # MAD is 0 when more than half of the readings are equal (e.g. many 0 readings):
+        # use the mean absolute deviation instead, scaled to the MAD
+        # (for normal data MAD = 0.6745 sigma and mean absolute deviation = 0.7979 sigma)
+        mean_ad = abs_deviation.groupby(groups, observed=True, sort=False).transform('mean') * 0.6745 / 0.7979
+        mad = mad.where(mad > 0, mean_ad)
+        lower = median - threshold * mad / 0.6745
+        upper = median + threshold * mad / 0.6745
+    elif method == 'iqr':
+        q1 = grouped.transform('quantile', 0.25)
+        q3 = grouped.transform('quantile', 0.75)
+        lower = q1 - threshold * (q3 - q1)
+        upper = q3 + threshold * (q3 - q1)
+    else:
+        raise ValueError(f"Invalid method: {method}. 'method' must be 'mad' or 'iqr'.")
+
+    return lower, upper
+
+
+def handle_consumption_outliers(invoice_data: pd.DataFrame,
+                                energy_type: str,
+                                method='mad',
+                                action='clip',
+                                threshold=None,
+                                levels=(1, 2, 3, 4),
+                                verbose=False) -> tuple:
+    """ Find outlying consumption readings per client and level and clip, flag or drop them.
+        Additionally count the outliers per client and level as new features.
+        Use it on the invoice data of one energy type before calculate_energy_consumption().
+
+    Args:
+        invoice_data (pd.DataFrame):    DF with columns 'client_id' and 'consumption_lvl_1' to 'consumption_lvl_4'.
+        energy_type (str):              Can be 'elec' or 'gas' (prefix of the count features).
+        method (str, optional):         'mad' or 'iqr' (see calculate_outlier_bounds()). Defaults to 'mad'.
+        action (str, optional):         'clip' to set outliers to the bounds,
+                                        'flag' to add a bool column consumption_lvl_(level)_outlier for each level,
+                                        'drop' to remove rows with an outlier in any level. Defaults to 'clip'.
+        threshold (float, optional):    Defaults to None (OUTLIER_THRESHOLDS of the method).
+        levels (tuple, optional):       Consumption levels. Defaults to (1, 2, 3, 4).
+        verbose (bool, optional):       Defaults to False. Set to True to print the number of outliers per level.
+
+    Returns:
+        tuple(pd.DataFrame, pd.DataFrame):  Invoice data with handled outliers and a DF with columns
+                                            client_id and (energy_type)_(level)_n_outliers.
+    """
+    columns = [f'consumption_lvl_{level}' for level in levels]
+    data = invoice_data.copy()
+
+    lower, upper = calculate_outlier_bounds(data[columns], data['client_id'], method, threshold)
+    is_outlier = (data[columns] < lower) | (data[columns] > upper)
+
+    # count features: number of outliers per client and level
+    outlier_counts = is_outlier.groupby(data['client_id'], observed=True).sum().reset_index()
+    outlier_counts.columns = ['client_id'] + [f'{energy_type}_{level}_n_outliers' for level in levels]
+
+    if action == 'clip':
+        data[columns] = data[columns].clip(lower, upper)
+    elif action == 'flag':
+        for column in columns:
+            data[f'{column}_outlier'] = is_outlier[column]
+    elif action == 'drop':
+        data = data[~is_outlier.any(axis=1)]
+    else:
+        raise ValueError(f"Invalid action: {action}. 'action' must be 'clip', 'flag' or 'drop'.")
+
+    if verbose:
+        for level, column in zip(levels, columns):
+            print(f'Level {level}: {is_outlier[column].sum()} outliers in {len(is_outlier)} readings.')
+
+    return data, outlier_counts
+
+
 #############################################
 ### Calculate energy consumption features ###  - clientwise aggregation
 #############################################
@@ -0,0 +1,207 @@
+##############################################
+### Batch export of all EDA report figures ### - headless, in parallel, only when the data changed
+##############################################
+
+# The images in the Images folder are created by running the EDA notebook interactively.
+# render_report() draws all report figures with the non-interactive 'Agg' backend straight to files:
+#
+#   1) build_report_figures()  -> list of figures with precomputed aggregates and box plot statistics
+#                                 (only the small aggregated data is sent to the worker processes)
+#   2) render_report()         -> figures are spread across a process pool,
+#                                 a figure is skipped when the hash of its input data has not changed
+#                                 (hashes are kept in a manifest file in the cache folder, not in Images)
+#
+# Example (after a monthly data drop):
+#   figures = build_report_figures(df_client, df_merged)
+#   render_report(figures)
+
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+import plotting
+from memoization import CACHE_DIR, hash_dataframe
+
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Images')
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'report_manifest.json')  # hash of the input data of each image
+
+
+##########################
+### Figure definitions ###
+##########################
+
+
+def build_report_figures(df_client: pd.DataFrame, df_merged: pd.DataFrame) -> list:
+    """ Define all report figures with their (precomputed) input data.
+
+    Args:
+        df_client (pd.DataFrame):   Client data with column 'target'.
+        df_merged (pd.DataFrame):   Client features (one row per client) with the account duration
+                                    and consumption features and column 'target'.
+
+    Returns:
+        list:                       One dict per figure with the keys 'file' (image file name),
+                                    'function' (plotting function in plotting.py) and 'kwargs' (its arguments).
+    """
+    figures = [{'file': 'pie_plot_fraud_rate.png',
+                'function': 'create_fraud_freq_pieplot',
+                'kwargs': {'client_data': None,
+                           'fraud_proportion': plotting.get_fraud_proportion(df_client)},
+                }]
+
+    duration_columns = ['target', 'elec_acc_dur_days', 'gas_acc_dur_days', 'difference_acc_dur']
+    if all(column in df_merged.columns for column in duration_columns):
+        figures.append({'file': 'boxplot_account_duration.png',
+                        'function': 'boxplot_account_duration',
+                        'kwargs': {'data': None,
+                                   'box_stats': [plotting.calculate_box_stats(df_merged, column)
+                                                 for column in duration_columns[1:]]},
+                        })
+
+    for energy_type, short in [('elec', 'e'), ('gas', 'g')]:
+        # monthly consumption: aggregated over all clients by month and target
+        monthly_columns = [f'{energy_type}_{level}_mon_{month}_mean' for level in range(1, 5) for month in range(1, 13)]
+        if all(column in df_merged.columns for column in monthly_columns):
+            aggregated_data = [plotting.aggregate_monthly_consumption(df_merged, energy_type, level)
+                               for level in range(1, 5)]
+            # same variants as in the EDA notebook: mean with std band, mean, max-min range
+            variants = [('mean', 'std'), ('mean', None), ('max_min_range', None)]
+            for i, (metric, error_metric) in enumerate(variants, start=1):
+                figures.append({'file': f'lineplot_monthly_{short}_consumption_{i}.png',
+                                'function': 'plot_monthly_consumption',
+                                'kwargs': {'data_df': None, 'energy_type': energy_type, 'metric': metric,
+                                           'error_metric': error_metric, 'aggregated_data': aggregated_data},
+                                })
+
+        # consumption per level: only the columns that are plotted
+        level_columns = ['target'] + [f'{energy_type}_{level}_mean' for level in range(1, 5)]
+        if all(column in df_merged.columns for column in level_columns):
+            for show_outliers in [True, False]:
+                suffix = '' if show_outliers else '_no_outliers'
+                box_stats = [plotting.calculate_box_stats(df_merged, column, show_outliers=show_outliers)
+                             for column in level_columns[1:]]
+                figures.append({'file': f'boxplot_{short}_consumption_per_level{suffix}.png',
+                                'function': 'boxplot_consumption_per_level',
+                                'kwargs': {'data': None, 'energy_type': energy_type, 'feature': 'mean',
+                                           'show_outliers': show_outliers, 'box_stats': box_stats},
+                                })
+
+    return figures
+
+
+def update_digest(digest, value):
+    """ Add a value to the hash: content of DFs and arrays, lists and dicts element by element,
+        other values with repr() (the repr() of large arrays is shortened with '...').
+    """
+    if isinstance(value, pd.DataFrame):
+        digest.update(hash_dataframe(value).encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(f'{value.dtype}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        for element in value:
+            update_digest(digest, element)
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(str(key).encode())
+            update_digest(digest, value[key])
+    else:
+        digest.update(repr(value).encode())
+
+
+def hash_figure(figure: dict) -> str:
+    """ Hash of the plotting function and its arguments (see update_digest()).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(figure['function'].encode())
+
+    for name, value in figure['kwargs'].items():
+        digest.update(name.encode())
+        update_digest(digest, value)
+
+    return digest.hexdigest()
+
+
+#################
+### Rendering ###
+#################
+
+
+def init_worker():
+    """ Use the non-interactive backend in each worker process (no display needed).
+    """
+    matplotlib.use('Agg')
+
+
+def render_figure(figure: dict, output_dir: str) -> str:
+    """ Draw one figure with its plotting function and save it to output_dir.
+
+    Returns:
+        str:    Path of the image file.
+    """
+    path = os.path.join(output_dir, figure['file'])
+    getattr(plotting, figure['function'])(**figure['kwargs'], save_path=path)
+
+    return path
+
+
+def render_report(figures: list, output_dir=IMAGES_DIR, manifest_path=MANIFEST_PATH, max_workers=None, force=False,
+                  verbose=True) -> pd.DataFrame:
+    """ Render all figures in parallel. Figures whose input data has not changed since
+        the last run (same hash in the manifest file) and whose image exists are skipped.
+
+    Args:
+        figures (list):                 Output of build_report_figures().
+        output_dir (str, optional):     Folder of the images. Defaults to IMAGES_DIR.
+        manifest_path (str, optional):  Json file with the hash of each image. Defaults to MANIFEST_PATH.
+        max_workers (int, optional):    Number of processes. Defaults to None (number of CPUs).
+        force (bool, optional):         Set to True to render all figures. Defaults to False.
+        verbose (bool, optional):       Defaults to True. If False no summary is printed.
+
+    Returns:
+        pd.DataFrame:                   Columns 'file' and 'status' ('rendered' or 'skipped').
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+
+    # manifest entries are keyed by the image path, so several output folders can share one manifest
+    paths = {figure['file']: os.path.normpath(os.path.abspath(os.path.join(output_dir, figure['file'])))
+             for figure in figures}
+    hashes = {figure['file']: hash_figure(figure) for figure in figures}
+    to_render = [figure for figure in figures
+                 if force
+                 or manifest.get(paths[figure['file']]) != hashes[figure['file']]
+                 or not os.path.exists(paths[figure['file']])]
+
+    if to_render:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+            # result() re-raises errors of the worker processes
+            for future in [executor.submit(render_figure, figure, output_dir) for figure in to_render]:
+                future.result()
+
+    # the manifest is only updated when all figures were rendered without errors
+    for figure in to_render:
+        manifest[paths[figure['file']]] = hashes[figure['file']]
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    rendered = {figure['file'] for figure in to_render}
+    report = pd.DataFrame({'file': [figure['file'] for figure in figures],
+                           'status': ['rendered' if figure['file'] in rendered else 'skipped' for figure in figures]})
+
+    if verbose:
+        print(f"{len(rendered)} figures rendered, {len(figures) - len(rendered)} skipped (unchanged data).")
+
+    return report